@@ -1,4 +1,5 @@
 import numpy as np
+import cv2
 """
 Data AUGmentation
 --------------
@@ -6,9 +7,12 @@ Module for image data augmentation.
 """
 
 
+_rng = np.random.default_rng()
+
+
 def _force_RGB_array(img):
     """
-    Ensures image is in the form of a (h, w, 3) array.
+    Ensures image is in the form of a C-contiguous (h, w, 3) uint8 array.
 
     Not intended for standalone use.
 
@@ -19,18 +23,60 @@ def _force_RGB_array(img):
 
     Returns
     --------
-    An array with shape (h, w, 3), where h is the height and w is the width of the original array
+    A uint8 array with shape (h, w, 3), where h is the height and w is the width of the original array.
+    Values outside 0-255 are clipped. The input is returned as is when it already has this form.
     """
-    if not isinstance(img, np.array):
-        img = np.array(img)
-    if len(img.shape) == 3:
-        return img
-    elif len(img.shape) == 2:
-        img = np.dstack([img, img, img])
+    if (type(img) is np.ndarray and img.ndim == 3 and img.shape[2] == 3
+            and img.dtype == np.uint8 and img.flags.c_contiguous):
         return img
+    if not isinstance(img, np.ndarray):
+        img = np.asarray(img)
+    if img.ndim == 2:
+        img = np.repeat(img[:, :, None], 3, axis=2)
+    if img.dtype != np.uint8:
+        img = np.clip(img, 0, 255).astype(np.uint8)
+    if not img.flags.c_contiguous:
+        img = np.ascontiguousarray(img)
+    return img
 
 
-def rot90(img, ccw=False):
+def _cv2_geometric(img, op, shape, out):
+    """
+    Runs a cv2 flip or rotation on img, writing into out the way the numpy-based functions do.
+
+    Not intended for standalone use.
+
+    Parameters
+    ----------
+    img - array as returned by _force_RGB_array
+
+    op - function of (src, dst) making the cv2 call; dst is None when cv2 should allocate the result
+
+    shape - shape of the result
+
+    out - optional array to write the result into. It is handed to cv2 directly only if it
+    matches the result exactly; otherwise the result is copied into it with np.copyto, which
+    raises on a mismatched shape.
+
+    Returns
+    -------
+    out if given, otherwise the resulting array.
+    """
+    if img.size == 0:
+        # cv2 returns None for empty input
+        img = np.empty(shape, dtype=img.dtype)
+    elif (out is not None and out.shape == shape and out.dtype == img.dtype
+            and out.flags.c_contiguous):
+        return op(img, out)
+    else:
+        img = op(img, None)
+    if out is not None:
+        np.copyto(out, img)
+        return out
+    return img
+
+
+def rot90(img, ccw=False, out=None):
     """
     Rotates image 90 degrees.
 
@@ -40,17 +86,21 @@ def rot90(img, ccw=False):
 
     ccw - if true, rotates the image counterclockwise. False by default.
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to image, rotated 90 degrees.
     """
     img = _force_RGB_array(img)
-    k = -1 if ccw else 1
-    img = np.rot90(img, k)
+    code = cv2.ROTATE_90_COUNTERCLOCKWISE if ccw else cv2.ROTATE_90_CLOCKWISE
+    h, w, c = img.shape
+    img = _cv2_geometric(img, lambda src, dst: cv2.rotate(src, code, dst=dst), (w, h, c), out)
     return img
 
 
-def flipv(img):
+def flipv(img, out=None):
     """
     Flips the image vertically (against the central horizontal axis)
 
@@ -58,16 +108,19 @@ def flipv(img):
     ----------
     img - image to flip
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the input image, flipped vertically.
     """
     img = _force_RGB_array(img)
-    img = np.flipud(img)
+    img = _cv2_geometric(img, lambda src, dst: cv2.flip(src, 0, dst=dst), img.shape, out)
     return img
 
 
-def fliph(img):
+def fliph(img, out=None):
     """
     Flips the image horizontally (against the central vertical axis)
 
@@ -75,12 +128,15 @@ def fliph(img):
     ----------
     img - image to flip
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the input image, flipped horizontally.
     """
     img = _force_RGB_array(img)
-    img = np.fliplr(img)
+    img = _cv2_geometric(img, lambda src, dst: cv2.flip(src, 1, dst=dst), img.shape, out)
     return img
 
 
@@ -101,8 +157,12 @@ def rolldown(img, px):
     Array corresponding to image, rolled down or up by px rows.
     """
     img = _force_RGB_array(img)
-    px = int(px)
-    img = np.roll(img, px, axis=0)
+    if img.shape[0] == 0:
+        return img
+    px = int(px) % img.shape[0]
+    if px == 0:
+        return img
+    img = np.concatenate((img[-px:, :, :], img[:-px, :, :]), axis=0)
     return img
     
 
@@ -123,28 +183,31 @@ def rollright(img, px):
     Array corresponding to image, rolled right or left by px rows.
     """
     img = _force_RGB_array(img)
-    px = int(px)
-    img = np.roll(img, px, axis=1)
+    if img.shape[1] == 0:
+        return img
+    px = int(px) % img.shape[1]
+    if px == 0:
+        return img
+    img = np.concatenate((img[:, -px:, :], img[:, :-px, :]), axis=1)
     return img
 
 
-def zoom(img, fac=.5):
+def _zoom_bounds(h, w, fac):
     """
-    Zooms into the center of an image by fac.
+    Computes the bounds of the central region kept by zoom.
+
+    Not intended for standalone use.
 
     Parameters
     ----------
-    img - image to zoom
+    h, w - height and width of the image
 
-    fac - percantage of the image to zoom; 2-long list or tuple of floats, or float. If float, image is zoomed by fac in each direction.
-    If list or tuple, zoomed by fac[0]*height vertically and fac[1]*width horizontally. In both cases floats
-    should be between 0 and 1.
+    fac - zoom factor, as accepted by zoom
 
     Returns
     -------
-    Array corresponding to the central (height*fac, width*fac) region of the image.
+    Bounds in the form accepted by crop: [[y_start, y_stop], [x_start, x_stop]]
     """
-    img = _force_RGB_array(img)
     if not isinstance(fac, tuple) and not isinstance(fac, list):
         fac = (fac, fac)
     if fac[0] > 1:
@@ -155,9 +218,30 @@ def zoom(img, fac=.5):
         fac = (.5, fac[1])
     if fac[1] <= 0:
         fac = (fac[0], .5)
-    h, w, _ = img.shape
     bounds_h = [int(h/2-h*(fac[0]/2.)), int(h/2+h*(fac[0]/2.))]
     bounds_w = [int(w/2-w*(fac[1]/2.)), int(w/2+w*(fac[1]/2.))]
+    return [bounds_h, bounds_w]
+
+
+def zoom(img, fac=.5):
+    """
+    Zooms into the center of an image by fac.
+
+    Parameters
+    ----------
+    img - image to zoom
+
+    fac - percantage of the image to zoom; 2-long list or tuple of floats, or float. If float, image is zoomed by fac in each direction.
+    If list or tuple, zoomed by fac[0]*height vertically and fac[1]*width horizontally. In both cases floats
+    should be between 0 and 1.
+
+    Returns
+    -------
+    Array corresponding to the central (height*fac, width*fac) region of the image.
+    """
+    img = _force_RGB_array(img)
+    h, w, _ = img.shape
+    bounds_h, bounds_w = _zoom_bounds(h, w, fac)
     img = img[bounds_h[0]:bounds_h[1], bounds_w[0]:bounds_w[1], :]
     return img
     
@@ -182,6 +266,93 @@ def crop(img, bounds):
     return img
 
 
+class AugPipeline:
+    """
+    Chain of geometric augmentations applied to an image in a single pass.
+
+    Each of rot90, flipv, fliph, zoom and crop is recorded as an affine map of pixel
+    coordinates. apply composes them into one matrix and resamples the image once with
+    cv2.warpAffine, instead of materializing an intermediate array per step.
+    All maps are integer-aligned, so pixels are copied without interpolation.
+
+    Usage
+    -----
+    AugPipeline().fliph().zoom(.5).rot90().apply(img)
+    """
+
+    def __init__(self):
+        self._ops = []
+
+    def rot90(self, ccw=False):
+        """
+        Rotates the image 90 degrees; clockwise unless ccw is true.
+        """
+        if ccw:
+            self._ops.append(lambda h, w: ([[0, 1, 0], [-1, 0, w - 1]], w, h))
+        else:
+            self._ops.append(lambda h, w: ([[0, -1, h - 1], [1, 0, 0]], w, h))
+        return self
+
+    def flipv(self):
+        """
+        Flips the image vertically (against the central horizontal axis).
+        """
+        self._ops.append(lambda h, w: ([[1, 0, 0], [0, -1, h - 1]], h, w))
+        return self
+
+    def fliph(self):
+        """
+        Flips the image horizontally (against the central vertical axis).
+        """
+        self._ops.append(lambda h, w: ([[-1, 0, w - 1], [0, 1, 0]], h, w))
+        return self
+
+    def crop(self, bounds):
+        """
+        Crops the image within bounds, given in the same form as for crop.
+        """
+        self._ops.append(lambda h, w: AugPipeline._crop_map(h, w, bounds))
+        return self
+
+    def zoom(self, fac=.5):
+        """
+        Zooms into the center of the image by fac, as zoom does.
+        """
+        self._ops.append(lambda h, w: AugPipeline._crop_map(h, w, _zoom_bounds(h, w, fac)))
+        return self
+
+    @staticmethod
+    def _crop_map(h, w, bounds):
+        # resolve bounds exactly as img[y0:y1, x0:x1] would, including negative indices
+        y0, y1, _ = slice(*bounds[0]).indices(h)
+        x0, x1, _ = slice(*bounds[1]).indices(w)
+        return [[1, 0, -x0], [0, 1, -y0]], max(y1 - y0, 0), max(x1 - x0, 0)
+
+    def apply(self, img):
+        """
+        Applies the recorded augmentations to img.
+
+        Parameters
+        ----------
+        img - image to augment
+
+        Returns
+        -------
+        Array corresponding to the augmented image.
+        """
+        img = _force_RGB_array(img)
+        if not self._ops:
+            return img
+        h, w, _ = img.shape
+        M = np.eye(3)
+        for op in self._ops:
+            A, h, w = op(h, w)
+            M = np.vstack([A, [0, 0, 1]]) @ M
+        if h == 0 or w == 0:
+            return np.empty((h, w, 3), dtype=img.dtype)
+        return cv2.warpAffine(img, M[:2], (w, h), flags=cv2.INTER_NEAREST)
+
+
 def noisy(img, amt):
     """
     Adds noise to the image.
@@ -194,15 +365,17 @@ def noisy(img, amt):
 
     Returns
     -------
-    Input image in the form of a 3-dimensional array, with added noise.
+    Input image in the form of a 3-dimensional uint8 array, with added noise.
     """
     img = _force_RGB_array(img)
-    noise = np.random.uniform(size=img.shape) * 255
-    img = img + noise*amt
+    amt = min(max(amt, 0), 1)
+    noise = _rng.integers(0, int(255*amt) + 1, size=img.shape, dtype=np.uint8)
+    img = np.add(img, noise, dtype=np.uint16)
+    img = img.clip(0, 255).astype(np.uint8)
     return img
 
 
-def mirrorleft(img):
+def mirrorleft(img, out=None):
     """
     Mirrors the left half of the image to the right.
 
@@ -210,18 +383,25 @@ def mirrorleft(img):
     ---------
     img - image to mirror
 
+    out - optional array of the image's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, img is mirrored in place.
+
     Returns
     ------
     Array corresponding to image, symmetrical against the vertical axis.
     """
     img = _force_RGB_array(img)
-    flipclone = np.fliplr(img)
-    bnd = img.shape[1] // 2
-    img[:, bnd:, :] = flipclone[:, bnd:, :]
-    return img
+    w = img.shape[1]
+    bnd = w // 2
+    if out is None:
+        out = img
+    else:
+        out[:, :bnd, :] = img[:, :bnd, :]
+    out[:, bnd:, :] = img[:, :w - bnd, :][:, ::-1, :]
+    return out
 
 
-def mirrorright(img):
+def mirrorright(img, out=None):
     """
     Mirrors the right half of the image to the left.
 
@@ -229,18 +409,25 @@ def mirrorright(img):
     ---------
     img - image to mirror
 
+    out - optional array of the image's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, img is mirrored in place.
+
     Returns
     ------
     Array corresponding to image, symmetrical against the vertical axis.
     """
     img = _force_RGB_array(img)
-    flipclone = np.fliplr(img)
-    bnd = img.shape[1] // 2
-    img[:, :bnd, :] = flipclone[:, :bnd, :]
-    return img
+    w = img.shape[1]
+    bnd = w // 2
+    if out is None:
+        out = img
+    else:
+        out[:, bnd:, :] = img[:, bnd:, :]
+    out[:, :bnd, :] = img[:, w - bnd:, :][:, ::-1, :]
+    return out
 
 
-def mirrorup(img):
+def mirrorup(img, out=None):
     """
     Mirrors the upper half of the image to the bottom.
 
@@ -248,18 +435,25 @@ def mirrorup(img):
     ---------
     img - image to mirror
 
+    out - optional array of the image's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, img is mirrored in place.
+
     Returns
     ------
     Array corresponding to image, symmetrical against the hoizontal axis.
     """
     img = _force_RGB_array(img)
-    flipclone = np.flipud(img)
-    bnd = img.shape[0] // 2
-    img[bnd:, :, :] = flipclone[bnd:, :, :]
-    return img
+    h = img.shape[0]
+    bnd = h // 2
+    if out is None:
+        out = img
+    else:
+        out[:bnd, :, :] = img[:bnd, :, :]
+    out[bnd:, :, :] = img[:h - bnd, :, :][::-1, :, :]
+    return out
 
 
-def mirrordown(img):
+def mirrordown(img, out=None):
     """
     Mirrors the bottom half of the image to the top.
 
@@ -267,18 +461,25 @@ def mirrordown(img):
     ---------
     img - image to mirror
 
+    out - optional array of the image's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, img is mirrored in place.
+
     Returns
     ------
     Array corresponding to image, symmetrical against the hoizontal axis.
     """
     img = _force_RGB_array(img)
-    flipclone = np.flipud(img)
-    bnd = img.shape[0] // 2
-    img[:bnd, :, :] = flipclone[:bnd, :, :]
-    return img
+    h = img.shape[0]
+    bnd = h // 2
+    if out is None:
+        out = img
+    else:
+        out[bnd:, :, :] = img[bnd:, :, :]
+    out[:bnd, :, :] = img[h - bnd:, :, :][::-1, :, :]
+    return out
 
 
-def shiftdown(img, px):
+def shiftdown(img, px, out=None):
     """
     Shifts the image down by px, with the gap at the top filled by stretching the topmost row of pixels.
 
@@ -288,19 +489,29 @@ def shiftdown(img, px):
 
     px - number of pixels to shift by
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the shifted image.
     """
-    px = abs(px)
-    img = rolldown(img, px)
-    if px > 0:
-        for i in range(px):
-            img[i, :, :] = img[px, :, :]
-    return img
+    img = _force_RGB_array(img)
+    h = img.shape[0]
+    px = min(abs(int(px)), h)
+    if px == 0:
+        if out is not None:
+            np.copyto(out, img)
+            return out
+        return img
+    if out is None:
+        out = np.empty_like(img)
+    out[px:, :, :] = img[:h - px, :, :]
+    out[:px, :, :] = img[:1, :, :]
+    return out
 
 
-def shiftup(img, px):
+def shiftup(img, px, out=None):
     """
     Shifts the image up by px, with the gap at the bottom filled by stretching the bottom row of pixels.
 
@@ -310,19 +521,29 @@ def shiftup(img, px):
 
     px - number of pixels to shift by
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the shifted image.
     """
-    px = abs(px)
-    img = rolldown(img, -px)
-    if px > 0:
-        for i in range(px):
-            img[img.shape[0] - i - 1, :, :] = img[img.shape[0] - px, :, :]
-    return img
+    img = _force_RGB_array(img)
+    h = img.shape[0]
+    px = min(abs(int(px)), h)
+    if px == 0:
+        if out is not None:
+            np.copyto(out, img)
+            return out
+        return img
+    if out is None:
+        out = np.empty_like(img)
+    out[:h - px, :, :] = img[px:, :, :]
+    out[h - px:, :, :] = img[-1:, :, :]
+    return out
 
 
-def shiftleft(img, px):
+def shiftleft(img, px, out=None):
     """
     Shifts the image left by px, with the gap at the right filled by stretching the rightmost row of pixels.
 
@@ -332,19 +553,29 @@ def shiftleft(img, px):
 
     px - number of pixels to shift by
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the shifted image.
     """
-    px = abs(px)
-    img = rollright(img, -px)
-    if px > 0:
-        for i in range(px):
-            img[:, img.shape[1] - i - 1, :] = img[:, img.shape[1] - px, :]
-    return img
+    img = _force_RGB_array(img)
+    w = img.shape[1]
+    px = min(abs(int(px)), w)
+    if px == 0:
+        if out is not None:
+            np.copyto(out, img)
+            return out
+        return img
+    if out is None:
+        out = np.empty_like(img)
+    out[:, :w - px, :] = img[:, px:, :]
+    out[:, w - px:, :] = img[:, -1:, :]
+    return out
 
 
-def shiftright(img, px):
+def shiftright(img, px, out=None):
     """
     Shifts the image right by px, with the gap at the left filled by stretching the leftmost row of pixels.
 
@@ -354,16 +585,26 @@ def shiftright(img, px):
 
     px - number of pixels to shift by
 
+    out - optional array of the result's shape and dtype to write the result into,
+    so a buffer can be reused across calls. If not given, the result is returned as usual.
+
     Returns
     -------
     Array corresponding to the shifted image.
     """
-    px = abs(px)
-    img = rollright(img, px)
-    if px > 0:
-        for i in range(px):
-            img[:, i, :] = img[:, px, :]
-    return img
+    img = _force_RGB_array(img)
+    w = img.shape[1]
+    px = min(abs(int(px)), w)
+    if px == 0:
+        if out is not None:
+            np.copyto(out, img)
+            return out
+        return img
+    if out is None:
+        out = np.empty_like(img)
+    out[:, px:, :] = img[:, :w - px, :]
+    out[:, :px, :] = img[:, :1, :]
+    return out
 
 
 
@@ -1,80 +1,154 @@
 import numpy as np
-from PIL import Image
+import cv2
 import pandas as pd 
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 
 home_dir = os.getcwd()
 subdir_prefix = 'archive/dayTrain/dayTrain/dayClip'
 annotation_prefix = 'archive/Annotations/Annotations/dayTrain/dayClip'
 subdir_range = range(1, 14)
-new_folder_loc1 = home_dir + 'processed/'
-new_folder_loc2 = new_folder_loc1 + 'day'
+new_folder_loc1 = os.path.join(home_dir, 'processed')
+new_folder_loc2 = os.path.join(new_folder_loc1, 'day')
+# per clip process; clips already run in parallel
+decode_workers = 2
+prefetch_depth = 8
+jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+
+def read_frame(path):
+    """
+    Decodes the image at path into a BGR array.
+
+    Raises IOError if the file is missing or cannot be decoded; cv2.imread only returns None.
+    """
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise IOError('Could not read ' + path)
+    return img
+
+
+def prefetch(paths, executor, depth=prefetch_depth):
+    """
+    Decodes images on executor, keeping up to depth decodes in flight.
+
+    Yields decoded BGR arrays in the order of paths.
+    """
+    pending = deque()
+    for path in paths:
+        pending.append(executor.submit(read_frame, path))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def wait_writes(writes):
+    """
+    Waits for cv2.imwrite calls submitted as (path, future) pairs.
+
+    Raises IOError if any write reported failure; exceptions raised by a write propagate.
+    Returns the number of files written.
+    """
+    for path, future in writes:
+        if not future.result():
+            raise IOError('Could not write ' + path)
+    return len(writes)
+
+
+def read_annotations(s_num):
+    """
+    Reads the box annotations of clip s_num.
+    """
+    anno_dir = annotation_prefix + str(s_num)
+    return pd.read_csv(os.path.join(home_dir, anno_dir, 'frameAnnotationsBOX.csv'), sep=';',
+                       engine='pyarrow')
 
 
-os.chdir(home_dir)
+def process_subdir(s_num, anno_file, green_cnt, red_cnt):
+    """
+    Crops the 'go' and 'stop' boxes of clip s_num into new_folder_loc2.
 
-cnt = 0
-green_cnt = 0
-red_cnt = 0
+    green_cnt and red_cnt are the numbers of green and red boxes in the preceding clips;
+    crops of this clip are numbered after them, so names match a sequential run.
 
-for s_num in subdir_range:
+    Returns the number of crops written.
+    """
     subdir = subdir_prefix + str(s_num) + '/frames'
-    anno_dir = annotation_prefix + str(s_num)
-    os.chdir(home_dir)
-    os.chdir(anno_dir)
-    anno_file = pd.read_csv('frameAnnotationsBOX.csv', sep=';')
-    os.chdir(home_dir)
-    os.chdir(subdir)
-    for root, dirs, files in os.walk('.'):
-        allfiles = files
-        break
-    imgs = [ f for f in allfiles if f.split('.')[-1]=='jpg']
-    for index, row in anno_file.iterrows():
-        i = Image.open(row['Filename'].split('/')[-1])
-        i_data = row
-        imgarr = np.array(i)
-        coords = [  [int(i_data['Upper left corner Y']),
-                     int(i_data['Upper left corner X'])],
-                    [int(i_data['Lower right corner Y']),
-                     int(i_data['Lower right corner X'])]]
-        # if coords[0][0] - coords[1][0] > -40 or coords[0][1] - coords[1][1] > -40:
-        #     continue
-
-
-
-        if i_data['Annotation tag'] == 'go':
-            green_cnt += 1
-            newfilename = 'green' + '_' + str(green_cnt) + '.jpg'
-        elif i_data['Annotation tag'] == 'stop':
-            red_cnt += 1
-            newfilename = 'red' + '_' + str(red_cnt) + '.jpg'
-        else:
-            continue
-        
-        newimg = imgarr[coords[0][0]:coords[1][0], coords[0][1]:coords[1][1], :]
-        try:
-            newi = Image.fromarray(newimg)
-        except ValueError:
-            continue
-        os.chdir(new_folder_loc2)
-        newi.save(newfilename)
-        os.chdir(home_dir)
-        os.chdir(subdir)
-
-        cnt += 1
-        if cnt%200==0:
-            print(cnt, 'images done')
-    print('Completed', s_num)
-
-
-
-
-
-
-print('All done, total:', cnt)
-print('Green:', green_cnt)
-print('Red:', red_cnt)
+    src_dir = os.path.join(home_dir, subdir)
+    y0s = anno_file['Upper left corner Y'].to_numpy(np.int32)
+    x0s = anno_file['Upper left corner X'].to_numpy(np.int32)
+    y1s = anno_file['Lower right corner Y'].to_numpy(np.int32)
+    x1s = anno_file['Lower right corner X'].to_numpy(np.int32)
+    tags = anno_file['Annotation tag'].to_numpy()
+    fnames = anno_file['Filename'].to_numpy()
+    # only 'go' and 'stop' boxes are kept; they are numbered in file order
+    is_go = tags == 'go'
+    is_stop = tags == 'stop'
+    ids = np.where(is_go, np.cumsum(is_go) + green_cnt, np.cumsum(is_stop) + red_cnt)
+    newfilenames = np.char.add(np.char.add(np.where(is_go, 'green_', 'red_'), ids.astype(str)), '.jpg')
+    kept = np.flatnonzero(is_go | is_stop)
+    # each frame is decoded once, however many boxes it has;
+    # frame_rows[j] holds the kept row indices of frames[j], in file order
+    frame_ids, frames = pd.factorize(fnames[kept])
+    frame_rows = np.split(kept[np.argsort(frame_ids, kind='stable')],
+                          np.cumsum(np.bincount(frame_ids))[:-1])
+    src_paths = [os.path.join(src_dir, fname.split('/')[-1]) for fname in frames]
+    cnt = 0
+    writes = []
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        for rows, imgarr in zip(frame_rows, prefetch(src_paths, executor)):
+            # writes of the previous frame had this frame's decode to finish in
+            cnt += wait_writes(writes)
+            writes = []
+            for k in rows:
+                y0, x0, y1, x1 = y0s[k], x0s[k], y1s[k], x1s[k]
+                # if y0 - y1 > -40 or x0 - x1 > -40:
+                #     continue
+
+                newfilename = newfilenames[k]
+                newimg = imgarr[y0:y1, x0:x1, :]
+                if newimg.size == 0:
+                    continue
+                # crops are read-only views of imgarr, so encoding can run alongside the loop
+                path = os.path.join(new_folder_loc2, newfilename)
+                writes.append((path, executor.submit(cv2.imwrite, path, newimg, jpeg_params)))
+        cnt += wait_writes(writes)
+    return cnt
+
+
+if __name__ == '__main__':
+    os.makedirs(new_folder_loc2, exist_ok=True)
+
+    # clips are independent; only their numbering offsets depend on the clips before them
+    anno_files = [read_annotations(s_num) for s_num in subdir_range]
+    green_offsets = []
+    red_offsets = []
+    green_cnt = 0
+    red_cnt = 0
+    for anno_file in anno_files:
+        green_offsets.append(green_cnt)
+        red_offsets.append(red_cnt)
+        green_cnt += int((anno_file['Annotation tag'] == 'go').sum())
+        red_cnt += int((anno_file['Annotation tag'] == 'stop').sum())
+
+    cnt = 0
+    with ProcessPoolExecutor(max_workers=min(len(subdir_range), os.cpu_count() or 1)) as pool:
+        results = pool.map(process_subdir, subdir_range, anno_files, green_offsets, red_offsets)
+        for s_num, clip_cnt in zip(subdir_range, results):
+            cnt += clip_cnt
+            print('Completed', s_num, '-', clip_cnt, 'images')
+
+
+
+
+
+
+    print('All done, total:', cnt)
+    print('Green:', green_cnt)
+    print('Red:', red_cnt)
 
 
 